@@ -0,0 +1,912 @@
+"""Differential equivalence harness for the VM translator.
+
+A VM program is translated twice:  once with the literal Generate*Code output of
+vmtranslator, which serves as the reference, and once with each optimized configuration of
+the translator.  Both translations are assembled and run on a Hack CPU simulator until they
+halt, and the final RAM states are compared.  The program is also run on the fast execution
+backend of vmexecutor and compared the same way.
+
+RAM that legitimately differs between correct translations is left out of the comparison:
+the scratch registers R13-R15, the dead part of the stack at and above SP, and the return
+address saved in each live call frame, which is a ROM address that depends on code layout.
+
+The program accepts either a path to a .vm file or directory, which is checked once, or
+--random=N to check N randomly generated well formed programs.  --seed=S makes the random
+programs reproducible and --cycles=N changes the CPU cycle budget.  When a program does not
+behave the same under every configuration it is minimized to a small repro, which is
+printed along with the differences.
+"""
+
+import sys
+import os
+import random
+
+from vmtranslator import CommandType, ArithmeticType, MemorySegment
+import vmtranslator
+import vmexecutor
+
+
+#Default limit on the number of CPU instructions executed by RunAssembly
+DEFAULT_CYCLE_BUDGET = 2000000
+
+#Registers the generated code uses as scratch space
+SCRATCH_REGISTERS = (13, 14, 15)
+
+#The stack ends where the heap begins
+HEAP_BASE = 2048
+
+#The differences listed for a failing configuration are cut off after this many addresses
+MAX_REPORTED_DIFFERENCES = 8
+
+
+"""Hack assembler and CPU simulator.
+
+Each instruction is decoded into a tuple.  An A-instruction is (value,) and a C-instruction
+is (compute, usesM, destA, destD, destM, jump) where compute is a function of A, D and M and
+jump is a bit mask of JGT (1), JEQ (2) and JLT (4).
+"""
+
+def InitializeComputeDictionary():
+    "Relate each comp field of a C-instruction to a function of A, D and M with a dictionary."
+
+    computations = {
+            "0"     :lambda a, d, m: 0,
+            "1"     :lambda a, d, m: 1,
+            "-1"    :lambda a, d, m: -1,
+            "D"     :lambda a, d, m: d,
+            "A"     :lambda a, d, m: a,
+            "M"     :lambda a, d, m: m,
+            "!D"    :lambda a, d, m: ~d,
+            "!A"    :lambda a, d, m: ~a,
+            "!M"    :lambda a, d, m: ~m,
+            "-D"    :lambda a, d, m: -d,
+            "-A"    :lambda a, d, m: -a,
+            "-M"    :lambda a, d, m: -m,
+            "D+1"   :lambda a, d, m: d + 1,
+            "A+1"   :lambda a, d, m: a + 1,
+            "M+1"   :lambda a, d, m: m + 1,
+            "D-1"   :lambda a, d, m: d - 1,
+            "A-1"   :lambda a, d, m: a - 1,
+            "M-1"   :lambda a, d, m: m - 1,
+            "D+A"   :lambda a, d, m: d + a,
+            "D+M"   :lambda a, d, m: d + m,
+            "D-A"   :lambda a, d, m: d - a,
+            "D-M"   :lambda a, d, m: d - m,
+            "A-D"   :lambda a, d, m: a - d,
+            "M-D"   :lambda a, d, m: m - d,
+            "D&A"   :lambda a, d, m: d & a,
+            "D&M"   :lambda a, d, m: d & m,
+            "D|A"   :lambda a, d, m: d | a,
+            "D|M"   :lambda a, d, m: d | m
+            }
+
+    #The assembler also accepts the commuted forms of the symmetric operations
+    for comp in ("D+A", "D+M", "D&A", "D&M", "D|A", "D|M"):
+        computations[comp[2] + comp[1] + comp[0]] = computations[comp]
+
+    return computations
+
+
+def InitializeJumpDictionary():
+    "Relate each jump field of a C-instruction to its bit mask with a dictionary."
+
+    jumps = {
+            ""      :0,
+            "JGT"   :1,
+            "JEQ"   :2,
+            "JGE"   :3,
+            "JLT"   :4,
+            "JNE"   :5,
+            "JLE"   :6,
+            "JMP"   :7
+            }
+
+    return jumps
+
+
+def InitializeSymbolDictionary():
+    "Relate each predefined assembler symbol to its address with a dictionary."
+
+    symbols = {
+            "SP"        :0,
+            "LCL"       :1,
+            "ARG"       :2,
+            "THIS"      :3,
+            "THAT"      :4,
+            "SCREEN"    :16384,
+            "KBD"       :24576
+            }
+
+    for register in range(16):
+        symbols["R" + str(register)] = register
+
+    return symbols
+
+
+def Assemble(asmText):
+    """Assemble Hack assembly text into a Python list of decoded instructions."""
+
+    computations = InitializeComputeDictionary()
+    jumps = InitializeJumpDictionary()
+    symbols = InitializeSymbolDictionary()
+
+    #First pass:  strip comments and white space and record label addresses
+    instructions = []
+
+    for hackCommand in asmText.split("\n"):
+        hackCommand = hackCommand.split("//", 1)[0].strip()
+
+        if not hackCommand:
+            continue
+
+        if hackCommand[0] == "(":
+            symbols[hackCommand[1:-1]] = len(instructions)
+        else:
+            instructions.append(hackCommand)
+
+    #Second pass:  decode instructions, allocating variables from RAM[16] on
+    rom = []
+    nextVariable = 16
+
+    for hackCommand in instructions:
+        if hackCommand[0] == "@":
+            symbol = hackCommand[1:]
+
+            if symbol.isdigit():
+                rom.append((int(symbol),))
+                continue
+
+            if symbol not in symbols:
+                symbols[symbol] = nextVariable
+                nextVariable += 1
+
+            rom.append((symbols[symbol],))
+            continue
+
+        dest, equals, rest = hackCommand.partition("=")
+
+        if not equals:
+            dest, rest = "", hackCommand
+
+        comp, semicolon, jump = rest.partition(";")
+
+        if comp not in computations or jump not in jumps:
+            raise ValueError("invalid instruction " + hackCommand)
+
+        rom.append((computations[comp], "M" in comp, "A" in dest, "D" in dest, "M" in dest, jumps[jump]))
+
+    return rom
+
+
+def RunAssembly(rom, maxCycles=DEFAULT_CYCLE_BUDGET):
+    """Run decoded instructions on a Hack CPU with all RAM cleared.
+
+    The program halts when it jumps to the A-instruction right before the jump,
+    which is how an infinite loop at the end of a program is translated, or when
+    it runs past the last instruction.  Returns an ExecutionResult whose steps are
+    CPU cycles.
+    """
+
+    ram = [0] * vmexecutor.RAM_SIZE
+
+    a = 0
+    d = 0
+    pc = 0
+    cycles = 0
+    halted = False
+    romSize = len(rom)
+
+    while cycles < maxCycles:
+        if pc >= romSize:
+            halted = True
+            break
+
+        instruction = rom[pc]
+        cycles += 1
+
+        if len(instruction) == 1:
+            a = instruction[0]
+            pc += 1
+            continue
+
+        compute, usesM, destA, destD, destM, jump = instruction
+
+        value = compute(a, d, ram[a] if usesM else 0) & 0xFFFF
+        address = a
+
+        if destM:
+            ram[address] = value
+        if destA:
+            a = value
+        if destD:
+            d = value
+
+        if jump and ((jump & 2 and value == 0) or (jump & 4 and value >= 0x8000) or (jump & 1 and 0 < value < 0x8000)):
+            if jump == 7 and address == pc - 1:
+                halted = True
+                break
+
+            pc = address
+        else:
+            pc += 1
+
+    return vmexecutor.ExecutionResult(ram, cycles, halted)
+
+
+"""Translator configurations.
+
+The literal translation joins the Generate*Code output of every command exactly as the
+translator originally did, and is the reference every configuration is compared against.
+"""
+
+def TranslateLiteral(processedLines):
+    """Translate processed lines with the literal Generate*Code functions."""
+
+    hackCommands = vmtranslator.GenerateBootStrapCode()
+
+    comparisonCount = 0
+    callCount = 0
+    functionName = "NONE"
+
+    for line in processedLines:
+        cType = line[0]
+
+        if cType == CommandType.Push:
+            translation = vmtranslator.GeneratePushCode(line)
+
+        elif cType == CommandType.Pop:
+            translation = vmtranslator.GeneratePopCode(line)
+
+        elif cType == CommandType.Arithmetic:
+            translation = vmtranslator.GenerateArithmeticCode(line)
+
+        elif cType == CommandType.Comparison:
+            comparisonCount += 1
+            translation = vmtranslator.GenerateComparisonCode(line, comparisonCount)
+
+        elif cType == CommandType.Label:
+            translation = vmtranslator.GenerateLabelCode(functionName + "$" + line[1])
+
+        elif cType == CommandType.Goto:
+            translation = vmtranslator.GenerateGotoCode(functionName + "$" + line[1])
+
+        elif cType == CommandType.IfGoto:
+            translation = vmtranslator.GenerateIfGotoCode(functionName + "$" + line[1])
+
+        elif cType == CommandType.Call:
+            callCount += 1
+            returnName = line[1] + ".RETURN" + ":" + str(callCount)
+            translation = vmtranslator.GenerateFunctionCallCode(line[1], line[2], returnName)
+
+        elif cType == CommandType.Function:
+            functionName = line[1]
+            translation = vmtranslator.GenerateFunctionDefinitionCode(functionName, line[2])
+
+        elif cType == CommandType.Return:
+            translation = vmtranslator.GenerateReturnCode()
+
+        hackCommands.extend(translation)
+
+    return "\n".join(hackCommands) + "\n"
+
+
+#Lines run at least this many times are hot when the harness translates with a profile,
+#so that short test programs get both inline and shared code
+PROFILE_HOT_THRESHOLD = 2
+
+
+def TranslateProfileGuided(processedLines):
+    """Translate processed lines guided by a profile taken from a run on the fast execution backend."""
+
+    #Processed lines carry no file names here, so each line is given a key of its own
+    sourceLines = [("Harness", index + 1) for index in range(len(processedLines))]
+    result, profile = vmexecutor.CompileProgram(processedLines).Profile(sourceLines)
+    options = vmtranslator.TranslationOptions(specializeFunctions=True, profile=profile, hotThreshold=PROFILE_HOT_THRESHOLD)
+
+    return "".join(vmtranslator.TranslateVMCommands(processedLines, options=options, sourceLines=sourceLines))
+
+
+def InitializeConfigurationDictionary():
+    "Relate the name of each translator configuration under test to a function that translates processed lines to assembly text."
+
+    specialized = vmtranslator.TranslationOptions(specializeFunctions=True)
+    compact = vmtranslator.TranslationOptions(compact=True)
+    compactSpecialized = vmtranslator.TranslationOptions(specializeFunctions=True, compact=True)
+    profileCold = vmtranslator.TranslationOptions(compact=True, profile={})
+
+    configurations = {
+            "templates"             :lambda processedLines: "".join(vmtranslator.TranslateVMCommands(processedLines)),
+            "specialized"           :lambda processedLines: "".join(vmtranslator.TranslateVMCommands(processedLines, options=specialized)),
+            "compact"               :lambda processedLines: "".join(vmtranslator.TranslateVMCommands(processedLines, options=compact)),
+            "compact specialized"   :lambda processedLines: "".join(vmtranslator.TranslateVMCommands(processedLines, options=compactSpecialized)),
+            "profile guided"        :TranslateProfileGuided,
+            "profile cold"          :lambda processedLines: "".join(vmtranslator.TranslateVMCommands(processedLines, options=profileCold))
+            }
+
+    return configurations
+
+
+"""Comparing machine states."""
+
+def ComparableRAM(ram):
+    """Return a copy of ram with the values that may differ between correct translations cleared."""
+
+    ram = list(ram)
+    sp = ram[0]
+
+    for register in SCRATCH_REGISTERS:
+        ram[register] = 0
+
+    #Values above the top of the stack are left over from popped values and finished calls
+    if vmexecutor.STACK_BASE <= sp < HEAP_BASE:
+        ram[sp:HEAP_BASE] = [0] * (HEAP_BASE - sp)
+
+    #Follow the saved LCL values down the chain of live frames and clear the return
+    #address of each.  The bootstrap call saves LCL=0, which ends the chain.
+    frame = ram[1]
+
+    while vmexecutor.STACK_BASE + 5 <= frame <= sp:
+        ram[frame - 5] = 0
+        nextFrame = ram[frame - 4]
+
+        if nextFrame >= frame:
+            break
+
+        frame = nextFrame
+
+    return ram
+
+
+def CompareResults(expected, actual):
+    """Return a Python list of the differences between two ExecutionResults, empty if they agree."""
+
+    if not expected.halted or not actual.halted:
+        if expected.halted != actual.halted:
+            return ["reference halted: " + str(expected.halted) + ", configuration halted: " + str(actual.halted)]
+
+        return []
+
+    expectedRAM = ComparableRAM(expected.ram)
+    actualRAM = ComparableRAM(actual.ram)
+
+    differences = []
+
+    for address in range(len(expectedRAM)):
+        if expectedRAM[address] != actualRAM[address]:
+            differences.append("RAM[" + str(address) + "] expected " + str(expectedRAM[address]) + " got " + str(actualRAM[address]))
+
+            if len(differences) == MAX_REPORTED_DIFFERENCES:
+                differences.append("...")
+                break
+
+    return differences
+
+
+def CheckProcessedLines(processedLines, configurations, maxCycles=DEFAULT_CYCLE_BUDGET):
+    """Run a parsed program under the reference translation and every configuration.
+
+    Returns a dictionary of configuration name to the Python list of differences found,
+    holding only the configurations that do not match the reference.  The fast execution
+    backend is checked under the name "executor".  If the reference run fails or does not
+    halt within maxCycles, nothing can be compared and a ValueError is raised.
+    """
+
+    try:
+        expected = RunAssembly(Assemble(TranslateLiteral(processedLines)), maxCycles)
+    except (ValueError, IndexError) as error:
+        raise ValueError("reference run failed with " + type(error).__name__ + ": " + str(error) + "; nothing compared")
+
+    if not expected.halted:
+        raise ValueError("reference did not halt within " + str(maxCycles) + " cycles; nothing compared")
+
+    failures = {}
+
+    for name, translate in configurations.items():
+        try:
+            actual = RunAssembly(Assemble(translate(processedLines)), maxCycles)
+            differences = CompareResults(expected, actual)
+        except (ValueError, IndexError) as error:
+            differences = [type(error).__name__ + ": " + str(error)]
+
+        if differences:
+            failures[name] = differences
+
+    #The executor counts VM commands, which always takes fewer steps than CPU cycles
+    try:
+        actual = vmexecutor.CompileProgram(processedLines).Run(maxCycles)
+        differences = CompareResults(expected, actual)
+    except (ValueError, IndexError) as error:
+        differences = [type(error).__name__ + ": " + str(error)]
+
+    if differences:
+        failures["executor"] = differences
+
+    return failures
+
+
+"""Minimizing failures."""
+
+def StackEffect(line):
+    """Return how many values a processed line pops from and pushes to the stack."""
+
+    cType = line[0]
+
+    if cType == CommandType.Push:
+        return 0, 1
+    if cType == CommandType.Pop or cType == CommandType.IfGoto or cType == CommandType.Return:
+        return 1, 0
+    if cType == CommandType.Comparison:
+        return 2, 1
+    if cType == CommandType.Arithmetic:
+        if line[1] == ArithmeticType.Neg or line[1] == ArithmeticType.Not:
+            return 1, 1
+
+        return 2, 1
+    if cType == CommandType.Call:
+        return line[2], 1
+
+    return 0, 0
+
+
+def IsWellFormed(processedLines):
+    """Check that a program only does what the generated random programs do.
+
+    A program minimized by deleting lines can go wrong in ways where the configurations may
+    legitimately disagree, such as reading the return address of a frame through the argument
+    segment.  Such candidates are rejected.
+    """
+
+    functions = {}
+    callArguments = {"Sys.init": [0]}
+
+    for line in processedLines:
+        if line[0] == CommandType.Function:
+            functions[line[1]] = line[2]
+        elif line[0] == CommandType.Call:
+            callArguments.setdefault(line[1], []).append(line[2])
+
+    if "Sys.init" not in functions or any(name not in functions for name in callArguments):
+        return False
+
+    functionName = "NONE"
+    labels = set()
+    jumps = set()
+    localCount = 0
+    argumentCount = 0
+    depth = 0
+    previous = None
+
+    for line in processedLines:
+        cType = line[0]
+
+        if cType == CommandType.Function:
+            functionName = line[1]
+            localCount = line[2]
+            #A function that is never called may read any argument
+            argumentCount = min(callArguments.get(line[1], [sys.maxsize]))
+            depth = 0
+
+        elif cType == CommandType.Push or cType == CommandType.Pop:
+            index = int(line[2])
+
+            if line[1] == MemorySegment.LCL and index >= localCount:
+                return False
+            if line[1] == MemorySegment.ARG and index >= argumentCount:
+                return False
+            if line[1] == MemorySegment.Temp and index > 7:
+                return False
+            if line[1] == MemorySegment.Pointer and index > 1:
+                return False
+
+            #Pointers may only be set to a constant heap address
+            if cType == CommandType.Pop and line[1] == MemorySegment.Constant:
+                return False
+
+            if cType == CommandType.Pop and line[1] == MemorySegment.Pointer:
+                if previous is None or previous[:2] != (CommandType.Push, MemorySegment.Constant):
+                    return False
+                if not HEAP_BASE <= int(previous[2]) < 16384:
+                    return False
+
+        #Sys.init has no caller to return to
+        elif cType == CommandType.Return and functionName == "Sys.init":
+            return False
+
+        if cType == CommandType.Label:
+            labels.add((functionName, line[1]))
+        elif cType == CommandType.Goto or cType == CommandType.IfGoto:
+            jumps.add((functionName, line[1]))
+
+        #Every command needs enough values on the stack of its own function
+        operands, results = StackEffect(line)
+
+        if depth < operands:
+            return False
+
+        depth += results - operands
+
+        previous = line
+
+    return jumps <= labels
+
+
+def ParseProgram(program):
+    """Parse a program held as a Python list of (file name, Python list of VM lines) pairs."""
+
+    sources = [(fileName, "\n".join(lines) + "\n") for fileName, lines in program]
+    processedLines, sourceLines, errors = vmtranslator.ParseVMFiles(sources)
+
+    if errors:
+        return None
+
+    return processedLines
+
+
+def MinimizeProgram(program, stillFails):
+    """Delete as many lines from a failing program as possible while it keeps failing.
+
+    program is a Python list of (file name, Python list of VM lines) pairs and
+    stillFails(program) tells whether a smaller candidate still fails.  This is the
+    ddmin delta debugging algorithm applied to the lines of all files together.
+    """
+
+    lines = [(fileName, line) for fileName, fileLines in program for line in fileLines]
+    fileNames = [fileName for fileName, fileLines in program]
+
+    def Regroup(candidate):
+        program = [(fileName, [line for lineFile, line in candidate if lineFile == fileName]) for fileName in fileNames]
+        return [(fileName, fileLines) for fileName, fileLines in program if fileLines]
+
+    chunks = 2
+
+    while len(lines) >= 2:
+        chunkSize = -(-len(lines) // chunks)
+        reduced = False
+
+        for start in range(0, len(lines), chunkSize):
+            candidate = lines[:start] + lines[start + chunkSize:]
+
+            if stillFails(Regroup(candidate)):
+                lines = candidate
+                chunks = max(chunks - 1, 2)
+                reduced = True
+                break
+
+        if not reduced:
+            if chunks >= len(lines):
+                break
+
+            chunks = min(len(lines), chunks * 2)
+
+    return Regroup(lines)
+
+
+def MinimizeFailure(program, name, configurations, maxCycles=DEFAULT_CYCLE_BUDGET):
+    """Minimize a program that fails under the named configuration ("executor" for the fast backend)."""
+
+    if name in configurations:
+        configurations = {name: configurations[name]}
+    else:
+        configurations = {}
+
+    def StillFails(candidate):
+        processedLines = ParseProgram(candidate)
+
+        if processedLines is None or not IsWellFormed(processedLines):
+            return False
+
+        #Deleting lines can still leave a program the reference run cannot finish
+        try:
+            return name in CheckProcessedLines(processedLines, configurations, maxCycles)
+        except ValueError:
+            return False
+
+    return MinimizeProgram(program, StillFails)
+
+
+"""Random program generation."""
+
+class RandomProgramGenerator:
+    """Generate random well formed VM programs.
+
+    Every function only calls functions defined after it, so programs always terminate.
+    Loops count down a counter kept in temp 7 and save the counter of any loop they run
+    inside of on the stack, so loop bodies may call functions that loop themselves.  Early
+    returns are only made outside of loops, where no saved counter would be lost.  Labels
+    are unique in the whole program.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.labelCount = 0
+
+    def NewLabel(self):
+        self.labelCount += 1
+        return "L" + str(self.labelCount)
+
+    def Generate(self, functionCount=4):
+        """Return a random program as a Python list of (file name, Python list of VM lines) pairs."""
+
+        rng = self.rng
+        files = {"Sys": [], "Main": [], "Util": []}
+
+        #(file name, function name, argument count, local count) of each function
+        functions = []
+
+        for number in range(functionCount):
+            fileName = rng.choice(["Main", "Util"])
+            functions.append((fileName, fileName + ".f" + str(number), rng.randint(0, 3), rng.choice([0, 1, 2, 3, 5, 9, 12])))
+
+        functions.insert(0, ("Sys", "Sys.init", 0, rng.randint(0, 4)))
+
+        for number, function in enumerate(functions):
+            self.lines = files[function[0]]
+            self.function = function
+            self.callees = functions[number + 1:]
+            self.pointersSet = False
+            self.loopDepth = 0
+
+            self.GenerateFunction()
+
+        return [(fileName, lines) for fileName, lines in files.items() if lines]
+
+    def Emit(self, line):
+        self.lines.append(line)
+
+    def GenerateFunction(self):
+        rng = self.rng
+        fileName, functionName, argumentCount, localCount = self.function
+
+        self.Emit("function " + functionName + " " + str(localCount))
+
+        if rng.random() < 0.4:
+            for pointer in range(2):
+                self.Emit("push constant " + str(rng.randint(3000, 3500)))
+                self.Emit("pop pointer " + str(pointer))
+
+            self.pointersSet = True
+
+        for statement in range(rng.randint(2, 8)):
+            self.GenerateStatement(True, True)
+
+        if functionName == "Sys.init":
+            self.Emit("label HALT")
+            self.Emit("goto HALT")
+        else:
+            self.GenerateExpression(0, True)
+            self.Emit("return")
+
+    def GenerateStatement(self, allowCalls, allowLoops):
+        rng = self.rng
+        choice = rng.random()
+
+        if choice < 0.5:
+            self.GenerateExpression(0, allowCalls)
+            self.Emit("pop " + self.ChooseTarget())
+
+        elif choice < 0.75:
+            thenLabel = self.NewLabel()
+            endLabel = self.NewLabel()
+
+            self.GenerateExpression(1, allowCalls)
+            self.Emit("if-goto " + thenLabel)
+
+            for statement in range(rng.randint(0, 2)):
+                self.GenerateStatement(allowCalls, False)
+
+            self.Emit("goto " + endLabel)
+            self.Emit("label " + thenLabel)
+
+            for statement in range(rng.randint(0, 2)):
+                self.GenerateStatement(allowCalls, False)
+
+            #Sometimes return early from the then branch
+            if self.function[1] != "Sys.init" and self.loopDepth == 0 and rng.random() < 0.3:
+                self.GenerateExpression(1, False)
+                self.Emit("return")
+
+            self.Emit("label " + endLabel)
+
+        elif choice < 0.85 and allowLoops:
+            loopLabel = self.NewLabel()
+
+            #Save the counter of the loop this one may run inside of, which can be in a caller
+            self.Emit("push temp 7")
+            self.Emit("push constant " + str(rng.randint(1, 4)))
+            self.Emit("pop temp 7")
+            self.Emit("label " + loopLabel)
+
+            self.loopDepth += 1
+
+            for statement in range(rng.randint(1, 3)):
+                self.GenerateStatement(allowCalls, False)
+
+            self.loopDepth -= 1
+
+            self.Emit("push temp 7")
+            self.Emit("push constant 1")
+            self.Emit("sub")
+            self.Emit("pop temp 7")
+            self.Emit("push temp 7")
+            self.Emit("if-goto " + loopLabel)
+            self.Emit("pop temp 7")
+
+        else:
+            self.GenerateExpression(0, allowCalls)
+            self.Emit("pop temp " + str(rng.randint(0, 6)))
+
+    def GenerateExpression(self, depth, allowCalls):
+        rng = self.rng
+        choice = rng.random()
+
+        if depth >= 3 or choice < 0.4:
+            self.Emit("push " + self.ChooseSource())
+
+        elif choice < 0.55:
+            self.GenerateExpression(depth + 1, allowCalls)
+            self.Emit(rng.choice(["neg", "not"]))
+
+        elif choice < 0.85 or not allowCalls or not self.callees:
+            self.GenerateExpression(depth + 1, allowCalls)
+            self.GenerateExpression(depth + 1, allowCalls)
+            self.Emit(rng.choice(["add", "sub", "and", "or", "eq", "gt", "lt"]))
+
+        else:
+            callee = rng.choice(self.callees)
+
+            for argument in range(callee[2]):
+                self.GenerateExpression(depth + 1, allowCalls)
+
+            self.Emit("call " + callee[1] + " " + str(callee[2]))
+
+    def ChooseSource(self):
+        """Return the segment and index of a random value to push."""
+
+        rng = self.rng
+        sources = ["constant " + str(rng.choice([0, 1, 2, rng.randint(0, 100), rng.randint(0, 32767)]))]
+        sources.append("static " + str(rng.randint(0, 3)))
+        sources.append("temp " + str(rng.randint(0, 7)))
+        sources.append("pointer " + str(rng.randint(0, 1)))
+
+        if self.function[3] > 0:
+            sources.append("local " + str(rng.randrange(self.function[3])))
+        if self.function[2] > 0:
+            sources.append("argument " + str(rng.randrange(self.function[2])))
+        if self.pointersSet:
+            sources.append(rng.choice(["this ", "that "]) + str(rng.randint(0, 5)))
+
+        return rng.choice(sources)
+
+    def ChooseTarget(self):
+        """Return the segment and index of a random location to pop into."""
+
+        rng = self.rng
+        targets = ["static " + str(rng.randint(0, 3)), "temp " + str(rng.randint(0, 6))]
+
+        if self.function[3] > 0:
+            targets.append("local " + str(rng.randrange(self.function[3])))
+        if self.function[2] > 0:
+            targets.append("argument " + str(rng.randrange(self.function[2])))
+        if self.pointersSet:
+            targets.append(rng.choice(["this ", "that "]) + str(rng.randint(0, 5)))
+
+        return rng.choice(targets)
+
+
+def CheckProgram(program, configurations, maxCycles=DEFAULT_CYCLE_BUDGET):
+    """Check a program and minimize it if it fails.
+
+    Returns a Python list of (configuration name, differences, minimized program)
+    for each failing configuration.  Raises a ValueError if the program does not parse
+    or the reference run cannot be compared.
+    """
+
+    processedLines = ParseProgram(program)
+
+    if processedLines is None:
+        raise ValueError("program does not parse")
+
+    failures = CheckProcessedLines(processedLines, configurations, maxCycles)
+
+    return [(name, differences, MinimizeFailure(program, name, configurations, maxCycles))
+            for name, differences in failures.items()]
+
+
+def PrintFailures(failures):
+    """Print the failures returned by CheckProgram."""
+
+    for name, differences, minimized in failures:
+        print("Configuration " + name + " does not match the literal translation:")
+
+        for difference in differences:
+            print("    " + difference)
+
+        print("Minimized program:")
+
+        for fileName, lines in minimized:
+            print("    // " + fileName + ".vm")
+
+            for line in lines:
+                print("    " + line)
+
+
+def Main(argv):
+    """Check the program at the given path, or random programs, against every configuration."""
+
+    inputPath = None
+    randomCount = 0
+    seed = None
+    maxCycles = DEFAULT_CYCLE_BUDGET
+    usage = "Usage: vmequivalence.py [--cycles=N] (path | --random=N [--seed=S])"
+
+    for argument in argv[1:]:
+        option, equals, value = argument.partition("=")
+
+        if option == "--random" and value.isdigit():
+            randomCount = int(value)
+        elif option == "--seed" and value.isdigit():
+            seed = int(value)
+        elif option == "--cycles" and value.isdigit():
+            maxCycles = int(value)
+        elif argument.startswith("--") or inputPath is not None:
+            print(usage)
+            return 2
+        else:
+            inputPath = argument
+
+    configurations = InitializeConfigurationDictionary()
+
+    if inputPath is not None:
+        if not os.path.exists(inputPath):
+            print(inputPath + " does not exist")
+            return 2
+
+        filePaths, outputFilePath = vmtranslator.FindVMFiles(inputPath)
+        sources = vmtranslator.ReadVMFiles(filePaths)
+        processedLines, sourceLines, errors = vmtranslator.ParseVMFiles(sources)
+
+        if vmtranslator.ReportProgramErrors(processedLines, errors):
+            return 2
+
+        program = [(fileName, source.split("\n")) for fileName, source in sources]
+
+        try:
+            failures = CheckProgram(program, configurations, maxCycles)
+        except ValueError as error:
+            print(error)
+            return 1
+
+        PrintFailures(failures)
+
+        if not failures:
+            print("All configurations match the literal translation")
+
+        return 1 if failures else 0
+
+    if randomCount == 0:
+        print(usage)
+        return 2
+
+    rng = random.Random(seed)
+
+    for number in range(randomCount):
+        program = RandomProgramGenerator(rng).Generate()
+
+        try:
+            failures = CheckProgram(program, configurations, maxCycles)
+        except ValueError as error:
+            print("Random program " + str(number + 1) + ": " + str(error))
+            return 1
+
+        if failures:
+            print("Random program " + str(number + 1) + " failed")
+            PrintFailures(failures)
+            return 1
+
+    print(str(randomCount) + " random programs match the literal translation under every configuration")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(Main(sys.argv))
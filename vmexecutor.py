@@ -0,0 +1,455 @@
+"""Fast execution backend for programs written in the VM language of chapters 7 and 8.
+
+Running a VM program by translating it to assembly and stepping a CPU simulator one
+instruction at a time is slow.  This backend reuses the processed lines built by
+vmtranslator and compiles each basic block of every VM function into a Python function.
+The generated source is passed to compile() once, and running the program is a loop that
+calls one block after another.
+
+The blocks work directly on a list based RAM with the same layout the translated assembly
+uses:  SP, LCL, ARG, THIS and THAT in RAM[0-4], the temp segment in RAM[5-12], static
+variables from RAM[16] on and the stack from RAM[256] on.  Calls and returns build and
+unwind the same stack frames, all values are 16-bit and wrap around, and comparisons
+subtract and test the sign of the 16-bit difference exactly like the assembly does.  The
+only value that differs is the return address saved in each frame, which is a block
+number here instead of a ROM address.
+
+The stack pointer is kept in a Python variable while a block runs and written back to RAM[0]
+at the end of the block, so a program that reads or writes RAM[0] through a memory segment
+will not behave as it does on the CPU.
+
+The program accepts the same path argument as vmtranslator and an optional --steps=N
+budget on the number of VM commands executed.  It prints the registers and the stack once
+the program halts or runs out of steps.  With --profile=FILE it also writes the execution
+count of every VM line to FILE, which vmtranslator reads to guide its translation.
+"""
+
+import sys
+import os
+
+from vmtranslator import CommandType, ArithmeticType, ComparisonType, MemorySegment
+import vmtranslator
+
+
+#Number of words in the Hack data memory
+RAM_SIZE = 32768
+
+#The stack starts at RAM[256]
+STACK_BASE = 256
+
+#The translated bootstrap code references the undefined symbol Dummy as the return address
+#of Sys.init, so the assembler allocates RAM[16] to it and static variables start at RAM[17]
+STATIC_BASE = 17
+
+#Default limit on the number of VM commands executed by Run
+DEFAULT_STEP_BUDGET = 10000000
+
+#Block 0 stops the program.  It is the return address of Sys.init and the
+#target of blocks that only jump to themselves.
+HALT_BLOCK = 0
+
+#RAM address of the base pointer of each memory segment that has one
+SEGMENT_POINTERS = {
+        MemorySegment.LCL   :1,
+        MemorySegment.ARG   :2,
+        MemorySegment.THIS  :3,
+        MemorySegment.THAT  :4
+        }
+
+#First RAM address of the segments that map to fixed registers
+SEGMENT_REGISTERS = {
+        MemorySegment.Pointer   :3,
+        MemorySegment.Temp      :5
+        }
+
+#Python expressions for the binary arithmetic commands.  x is the next-to-the-top
+#stack element and y the top element.
+BINARY_EXPRESSIONS = {
+        ArithmeticType.Add  :"(x + y) & 0xFFFF",
+        ArithmeticType.Sub  :"(x - y) & 0xFFFF",
+        ArithmeticType.And  :"x & y",
+        ArithmeticType.Or   :"x | y"
+        }
+
+#Python conditions for the comparison commands, applied to d = (x - y) & 0xFFFF
+COMPARISON_CONDITIONS = {
+        ComparisonType.EQ   :"d == 0",
+        ComparisonType.GT   :"0 < d < 0x8000",
+        ComparisonType.LT   :"d >= 0x8000"
+        }
+
+
+class ExecutionResult:
+    """The state of a VM program after Run returns."""
+
+    def __init__(self, ram, steps, halted):
+        #The whole data memory
+        self.ram = ram
+
+        #Number of VM commands executed
+        self.steps = steps
+
+        #True if the program reached a halting loop, False if it ran out of steps
+        self.halted = halted
+
+
+class Block:
+    """A straight run of VM commands that is only entered at its first command."""
+
+    def __init__(self, functionName):
+        self.functionName = functionName
+        self.lines = []
+        self.indices = []
+
+
+def AllocateStatics(processedLines):
+    """Relate each static variable symbol to its RAM address with a dictionary.
+
+    Addresses are handed out in the order the symbols first appear, which is the
+    order the assembler allocates them in for the translated program.
+    """
+
+    statics = {}
+
+    for line in processedLines:
+        if (line[0] == CommandType.Push or line[0] == CommandType.Pop) and line[1] == MemorySegment.Static:
+            symbol = line[3] + "." + line[2]
+
+            if symbol not in statics:
+                statics[symbol] = STATIC_BASE + len(statics)
+
+    return statics
+
+
+def SplitBlocks(processedLines):
+    """Split processed lines into basic blocks.
+
+    Returns the blocks, a dictionary of (function name, label) to block number and a
+    dictionary of function name to the block number of its entry.  Block 0 is the halt
+    block and holds no lines.
+    """
+
+    blocks = [Block("")]
+    labels = {}
+    functions = {}
+
+    functionName = "NONE"
+    block = None
+
+    for index, line in enumerate(processedLines):
+        cType = line[0]
+
+        #Functions and labels start a new block
+        if cType == CommandType.Function:
+            functionName = line[1]
+            block = None
+
+        elif cType == CommandType.Label:
+            block = None
+
+        if block is None:
+            block = Block(functionName)
+            blocks.append(block)
+
+        block.lines.append(line)
+        block.indices.append(index)
+
+        if cType == CommandType.Function:
+            functions[line[1]] = len(blocks) - 1
+
+        elif cType == CommandType.Label:
+            labels[(functionName, line[1])] = len(blocks) - 1
+
+        #Jumps, calls and returns end the block
+        elif cType in (CommandType.Goto, CommandType.IfGoto, CommandType.Call, CommandType.Return):
+            block = None
+
+    return blocks, labels, functions
+
+
+def SegmentAddress(line, statics):
+    """Return a Python expression for the RAM address a push or pop line accesses."""
+
+    segment = line[1]
+    index = int(line[2])
+
+    if segment in SEGMENT_POINTERS:
+        if index == 0:
+            return "ram[" + str(SEGMENT_POINTERS[segment]) + "]"
+
+        return "ram[" + str(SEGMENT_POINTERS[segment]) + "] + " + str(index)
+
+    if segment in SEGMENT_REGISTERS:
+        return str(SEGMENT_REGISTERS[segment] + index)
+
+    return str(statics[line[3] + "." + line[2]])
+
+
+def GenerateBlockSource(number, block, nextNumber, labels, functions, statics):
+    """Generate the Python source of the function that runs one block.
+
+    The function takes the RAM list and returns the number of the block to run next.
+    """
+
+    source = ["def block" + str(number) + "(ram):"]
+    body = ["sp = ram[0]"]
+    lastLine = block.lines[-1]
+
+    for line in block.lines:
+        cType = line[0]
+
+        if cType == CommandType.Push:
+            if line[1] == MemorySegment.Constant:
+                body.append("ram[sp] = " + str(int(line[2]) & 0xFFFF))
+            else:
+                body.append("ram[sp] = ram[" + SegmentAddress(line, statics) + "]")
+
+            body.append("sp += 1")
+
+        elif cType == CommandType.Pop:
+            if line[1] == MemorySegment.Constant:
+                raise ValueError("pop constant " + line[2] + " in " + block.functionName + " cannot be executed")
+
+            body.append("sp -= 1")
+            body.append("ram[" + SegmentAddress(line, statics) + "] = ram[sp]")
+
+        elif cType == CommandType.Arithmetic:
+            if line[1] == ArithmeticType.Neg:
+                body.append("ram[sp - 1] = -ram[sp - 1] & 0xFFFF")
+            elif line[1] == ArithmeticType.Not:
+                body.append("ram[sp - 1] ^= 0xFFFF")
+            else:
+                body.append("sp -= 1")
+                body.append("x = ram[sp - 1]")
+                body.append("y = ram[sp]")
+                body.append("ram[sp - 1] = " + BINARY_EXPRESSIONS[line[1]])
+
+        elif cType == CommandType.Comparison:
+            body.append("sp -= 1")
+            body.append("d = (ram[sp - 1] - ram[sp]) & 0xFFFF")
+            body.append("ram[sp - 1] = 0xFFFF if " + COMPARISON_CONDITIONS[line[1]] + " else 0")
+
+        elif cType == CommandType.Function:
+            if line[2] > 0:
+                body.append("ram[sp:sp + " + str(line[2]) + "] = (" + "0, " * line[2] + ")")
+                body.append("sp += " + str(line[2]))
+
+        elif cType == CommandType.Goto or cType == CommandType.IfGoto:
+            target = labels.get((block.functionName, line[1]))
+
+            if target is None:
+                raise ValueError("label " + line[1] + " is not defined in " + block.functionName)
+
+            #A block that only jumps to itself is a halting loop
+            if cType == CommandType.Goto and target == number and len(block.lines) == 2:
+                target = HALT_BLOCK
+
+            if cType == CommandType.Goto:
+                body.append("ram[0] = sp")
+                body.append("return " + str(target))
+            else:
+                body.append("sp -= 1")
+                body.append("ram[0] = sp")
+                body.append("if ram[sp]:")
+                body.append("    return " + str(target))
+                body.append("return " + str(nextNumber))
+
+        elif cType == CommandType.Call:
+            if line[1] not in functions:
+                raise ValueError("function " + line[1] + " called in " + block.functionName + " is not defined")
+
+            #Push the return address, LCL, ARG, THIS and THAT
+            body.append("ram[sp] = " + str(nextNumber))
+            body.append("ram[sp + 1] = ram[1]")
+            body.append("ram[sp + 2] = ram[2]")
+            body.append("ram[sp + 3] = ram[3]")
+            body.append("ram[sp + 4] = ram[4]")
+            body.append("sp += 5")
+
+            #Reposition ARG and LCL and jump to the called function
+            body.append("ram[2] = sp - " + str(5 + line[2]))
+            body.append("ram[1] = sp")
+            body.append("ram[0] = sp")
+            body.append("return " + str(functions[line[1]]))
+
+        elif cType == CommandType.Return:
+            #The return address is read first because a function without arguments
+            #overwrites it with the return value
+            body.append("frame = ram[1]")
+            body.append("returnAddress = ram[frame - 5]")
+            body.append("arg = ram[2]")
+            body.append("ram[arg] = ram[sp - 1]")
+            body.append("ram[0] = arg + 1")
+            body.append("ram[4] = ram[frame - 1]")
+            body.append("ram[3] = ram[frame - 2]")
+            body.append("ram[2] = ram[frame - 3]")
+            body.append("ram[1] = ram[frame - 4]")
+            body.append("return returnAddress")
+
+    #Blocks that do not end with a jump fall through to the next block
+    if lastLine[0] not in (CommandType.Goto, CommandType.IfGoto, CommandType.Call, CommandType.Return):
+        body.append("ram[0] = sp")
+        body.append("return " + str(nextNumber))
+
+    source.extend("    " + statement for statement in body)
+
+    return source
+
+
+class CompiledProgram:
+    """A VM program compiled to Python functions, one for each basic block."""
+
+    def __init__(self, processedLines):
+        blocks, labels, functions = SplitBlocks(processedLines)
+
+        if "Sys.init" not in functions:
+            raise ValueError("Sys.init function definition not found")
+
+        self.statics = AllocateStatics(processedLines)
+        self.entry = functions["Sys.init"]
+
+        #Number of VM commands in each block, used to count steps
+        self.blockSizes = [len(block.lines) for block in blocks]
+
+        #Processed line indices of the commands in each block, used to build profiles
+        self.blockIndices = [block.indices for block in blocks]
+
+        source = ["def block0(ram):", "    return -1", ""]
+
+        for number in range(1, len(blocks)):
+            #The last block falls through into the halt block
+            nextNumber = number + 1 if number + 1 < len(blocks) else HALT_BLOCK
+
+            source.extend(GenerateBlockSource(number, blocks[number], nextNumber, labels, functions, self.statics))
+            source.append("")
+
+        source.append("BLOCKS = [" + ", ".join("block" + str(number) for number in range(len(blocks))) + "]")
+
+        self.source = "\n".join(source) + "\n"
+
+        namespace = {}
+        exec(compile(self.source, "<vm program>", "exec"), namespace)
+        self.blocks = namespace["BLOCKS"]
+
+    def Run(self, maxSteps=DEFAULT_STEP_BUDGET, blockCounts=None):
+        """Run the program from Sys.init until it halts or has executed maxSteps VM commands.
+
+        The budget is checked between blocks, so a run may go over it by less than one block.
+        If blockCounts is a list with an element for each block, the number of times each
+        block runs is added to it.
+        """
+
+        ram = [0] * RAM_SIZE
+
+        #Bootstrap:  call Sys.init with the halt block as its return address
+        ram[0] = STACK_BASE + 5
+        ram[STACK_BASE] = HALT_BLOCK
+        ram[1] = STACK_BASE + 5
+        ram[2] = STACK_BASE
+
+        blocks = self.blocks
+        blockSizes = self.blockSizes
+
+        steps = 0
+        block = self.entry
+
+        if blockCounts is None:
+            while block >= 0 and steps < maxSteps:
+                steps += blockSizes[block]
+                block = blocks[block](ram)
+        else:
+            while block >= 0 and steps < maxSteps:
+                steps += blockSizes[block]
+                blockCounts[block] += 1
+                block = blocks[block](ram)
+
+        #The budget can run out just as control reaches the halt block
+        return ExecutionResult(ram, steps, block <= HALT_BLOCK)
+
+    def Profile(self, sourceLines, maxSteps=DEFAULT_STEP_BUDGET):
+        """Run the program and count how many times each VM line executes.
+
+        sourceLines is the list of (file name, line number) pairs from vmtranslator.ParseVMFiles.
+        Returns the ExecutionResult and a profile dictionary relating the profile key of
+        each executed line to its count, ready for vmtranslator.WriteProfile.
+        """
+
+        blockCounts = [0] * len(self.blocks)
+        result = self.Run(maxSteps, blockCounts)
+
+        #Every command in a block runs each time the block runs
+        profile = {}
+
+        for indices, count in zip(self.blockIndices, blockCounts):
+            if count > 0:
+                for index in indices:
+                    profile[vmtranslator.ProfileKey(*sourceLines[index])] = count
+
+        return result, profile
+
+
+def CompileProgram(processedLines):
+    """Compile the processed lines of a program for the fast execution backend."""
+
+    return CompiledProgram(processedLines)
+
+
+def Main(argv):
+    """Parse the .vm files at the given path, run the program and print the final machine state."""
+
+    inputPath = None
+    maxSteps = DEFAULT_STEP_BUDGET
+    profilePath = None
+    usage = "Usage: vmexecutor.py [--steps=N] [--profile=FILE] path"
+
+    for argument in argv[1:]:
+        if argument.startswith("--steps=") and argument[8:].isdigit():
+            maxSteps = int(argument[8:])
+        elif argument.startswith("--profile=") and len(argument) > 10:
+            profilePath = argument[10:]
+        elif argument.startswith("--") or inputPath is not None:
+            print(usage)
+            return
+        else:
+            inputPath = argument
+
+    if inputPath is None:
+        print(usage)
+        return
+
+    if not os.path.exists(inputPath):
+        print(inputPath + " does not exist")
+        return
+
+    filePaths, outputFilePath = vmtranslator.FindVMFiles(inputPath)
+    processedLines, sourceLines, errors = vmtranslator.ParseVMFiles(vmtranslator.ReadVMFiles(filePaths))
+
+    if vmtranslator.ReportProgramErrors(processedLines, errors):
+        return
+
+    try:
+        program = CompileProgram(processedLines)
+    except ValueError as error:
+        print(error)
+        return
+
+    if profilePath is None:
+        result = program.Run(maxSteps)
+    else:
+        result, profile = program.Profile(sourceLines, maxSteps)
+        vmtranslator.WriteProfile(profilePath, profile)
+
+    if result.halted:
+        print("Halted after " + str(result.steps) + " VM commands")
+    else:
+        print("Stopped after " + str(result.steps) + " VM commands")
+
+    ram = result.ram
+
+    print("SP=" + str(ram[0]) + " LCL=" + str(ram[1]) + " ARG=" + str(ram[2]) + " THIS=" + str(ram[3]) + " THAT=" + str(ram[4]))
+    print("temp: " + " ".join(str(value) for value in ram[5:13]))
+    print("stack: " + " ".join(str(value) for value in ram[STACK_BASE:ram[0]]))
+
+
+if __name__ == "__main__":
+    Main(sys.argv)
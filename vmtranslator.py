@@ -9,12 +9,34 @@ The program accepts one argument:  Either a directory path or a filename.vm file
 given a directory path, the program will translate every .vm file and output a single
 file called directory_name.asm.  If given a file path the program will translate the
 file and output a file called file_name.asm
+
+The optional --stats flag prints phase times, command counts and the emitted code size
+once the translation is done.  --stats=json prints the same statistics as JSON.
+
+The optional --specialize flag specializes the prologue and epilogue of each function:
+many local variables are zeroed with a loop, several returns share one epilogue, and the
+epilogue skips restoring THIS and THAT for functions that never change them.
+
+The optional --compact flag leaves comments and blank lines out of the .asm file and gives
+the labels the translator generates short names.  The short names are listed next to their
+original names in a file called file_name.map or directory_name.map.
+
+The optional --profile=FILE flag translates guided by a profile of execution counts, such
+as the one vmexecutor writes with its --profile flag.  Comparisons and calls on lines run
+at least 1000 times, or the count given with --hot=N, are translated inline for speed; all
+others jump to routines shared by the whole program to save ROM space.
 """
 
 import sys
 import glob
 import os
+import re
+import mmap
 import enum
+import functools
+import contextlib
+import time
+import json
 
 
 class CommandType(enum.Enum):
@@ -618,224 +640,1418 @@ def PushAddress(registerName):
     return pushCommands
 
 
-"""The main program translates VM code in two steps.  First it reads the .vm file, discards comments,
-strips out white space, parses the VM commands and arguments, and creates a list of processed commands.  
-Then it translates each processed line into assembly instructions and writes the .asm file.
+def GenerateLabelCode(labelName):
+    """Translate a VM Label command to a Python list of assembly instructions.
 
-If any invalid VM commands are found, they are written to the screen along with their line numbers, and
-the VM translation stops without creating a file.
-"""
+    labelName is the label already qualified with the name of its function.
+    """
+
+    commands = []
 
-inputPath = sys.argv[1]
+    #commands.append("\t\t//Label")
+    commands.append("")
+    commands.append("(" + labelName + ")")
+    commands.append("")
 
-filePaths = []
-outputFilePath = ""
+    return commands
 
-if os.path.exists(inputPath):
-    if inputPath[-3:] == ".vm":
-        filePaths.append(inputPath)
-        outputFilePath = inputPath[:-3] + ".asm"
+
+def GenerateGotoCode(labelName):
+    """Translate a VM Goto command to a Python list of assembly instructions."""
+
+    commands = []
+
+    #Load the address into A and jump
+    comment = "\t\t//Goto label " + labelName
+    commands.append("@" + labelName + comment)
+    commands.append("0;JMP")
+
+    return commands
+
+
+def GenerateIfGotoCode(labelName):
+    """Translate a VM If-Goto command to a Python list of assembly instructions."""
+
+    commands = []
+
+    commands.append("\t\t//If-Goto label " + labelName)
+            
+    #Get stack pointer
+    commands.append("@SP")
+
+    #Decrement the pointer value
+    commands.append("M=M-1")
+
+    #point to the top of the stack
+    commands.append("A=M")
+
+    #Save the top stack value into D
+    commands.append("D=M")
+
+    #Load the address into A and jump if D is non-zero
+    commands.append("@" + labelName)
+    commands.append("D;JNE")
+
+    return commands
+
+
+def GenerateLocalLoopCode(functionName, localVarCount, loopLabel):
+    """Translate a VM Function Definition command with a loop that zeroes the local variables.
+
+    The loop is a fixed 8 instructions, where GenerateFunctionDefinitionCode unrolls two
+    instructions per local variable.  localVarCount must be at least 1.
+    """
+
+    commands = []
+
+    #Create function label
+    comment = "\t\t//Function definition, " + str(localVarCount) + " local variables"
+    commands.append("")
+    commands.append("(" + functionName + ")" + comment)
+
+    #Count the local variables down in D
+    commands.append("@" + str(localVarCount))
+    commands.append("D=A")
+
+    #Push a zero for each local variable
+    commands.append("(" + loopLabel + ")")
+    commands.append("@SP")
+    commands.append("AM=M+1")
+    commands.append("A=A-1")
+    commands.append("M=0")
+
+    #Repeat until the count reaches zero
+    commands.append("@" + loopLabel)
+    commands.append("D=D-1;JGT")
+
+    return commands
+
+
+def GenerateSpecializedReturnCode(restorePointers, zeroArguments):
+    """Translate a VM Return command using what is known about the returning function.
+
+    If restorePointers is False the function never changes THIS or THAT, so the calling
+    function's values are still in place and are not restored.  If zeroArguments is True 
+    the function is always called without arguments, so ARG points at the saved return address.
+    """
+
+    commands = []
+
+    comment = "\t\t//Return control to calling function"
+    commands.append(comment)
+
+    #Temporarily save the return address in R13
+    if zeroArguments:
+        #The return address is where ARG points
+        commands.append("@ARG")
+        commands.append("A=M")
+        commands.append("D=M")
     else:
-        filePaths = glob.glob(inputPath + "/*.vm")
+        #The return address is 5 registers lower on the stack than LCL
+        commands.append("@5")
+        commands.append("D=A")
+        commands.append("@LCL")
+        commands.append("A=M-D")
+        commands.append("D=M")
 
-        dirNameStart = inputPath.rfind("/", 0, len(inputPath) - 1) 
-        dirName = inputPath[dirNameStart:].strip("/")
+    commands.append("@R13")
+    commands.append("M=D")
 
-        if inputPath[-1:] == "/":
-            outputFilePath = inputPath + dirName + ".asm"
-        else:
-            outputFilePath = inputPath + "/" + dirName + ".asm"
+    #Move the return value at the top of the stack to the current ARG location
+    #The current ARG location will be the top of the stack when the function is returned
+    commands.append("@SP")
+    commands.append("A=M-1")
+    commands.append("D=M")
+    commands.append("@ARG")
+    commands.append("A=M")
+    commands.append("M=D")
+    
+    #Move the stack pointer to one register above the current ARG location
+    commands.append("@ARG")
+    commands.append("D=M+1")
+    commands.append("@SP")
+    commands.append("M=D")
+
+    if restorePointers:
+        #THAT of the calling function is 1 register lower on the stack than where LCL points
+        commands.append("@LCL")
+        commands.append("A=M-1")
+        commands.append("D=M")
+        commands.append("@THAT")
+        commands.append("M=D")
+
+        #THIS of the calling function is 2 registers lower on the stack than where LCL points
+        commands.append("@2")
+        commands.append("D=A")
+        commands.append("@LCL")
+        commands.append("A=M-D")
+        commands.append("D=M")
+        commands.append("@THIS")
+        commands.append("M=D")
+
+    #ARG of the calling function is 3 registers lower on the stack than LCL
+    commands.append("@3")
+    commands.append("D=A")
+    commands.append("@LCL")
+    commands.append("A=M-D")
+    commands.append("D=M")
+    commands.append("@ARG")
+    commands.append("M=D")
+
+    #LCL of the calling function is 4 registers lower on the stack than the current LCL
+    commands.append("@4")
+    commands.append("D=A")
+    commands.append("@LCL")
+    commands.append("A=M-D")
+    commands.append("D=M")
+    commands.append("@LCL")
+    commands.append("M=D")
+
+    #Return control to the calling function
+    commands.append("@R13")
+    commands.append("A=M")
+    commands.append("0;JMP")
+
+    return commands
 
-else:
-    print(inputPath + " does not exist")
 
-processedLines = []
-errors = []
+def GenerateSharedComparisonCallCode(line, routineLabel, compareLabel):
+    """Translate a VM Comparison command to a jump to the shared routine for its comparison type.
 
-lineNumber = 0
+    The return address is passed in D and compareLabel marks it.
+    """
 
-commands = InitializeCommandTypeDictionary()
-arithmeticTypes = InitializeArithmeticTypeDictionary()
-memorySegments = InitializeMemorySegmentDictionary()
-comparisonTypes = InitializeComparisonTypeDictionary()
+    commands = []
 
-#Track the number of times a comparison is made.
-#comparisonCount is used to form label names for jumps
-#that are necessary for the comparison operators
-#and ensures the labels all have unique names.
-comparisonCount = 0
+    cType = line[1]
 
-#Track the number of time a function call is made.
-#callCount is used to form return labels and ensures
-#the labels all have unique names.
-callCount = 0
+    comment = "\t\t//Stack Compare " + cType.name + " in shared routine"
+    commands.append(comment)
 
-#Every program must have a Sys.init function
-#sys_init is set to true if a function def for Sys.init is found
-sys_init = False
+    #Pass the return address in D and jump to the routine
+    commands.append("@" + compareLabel)
+    commands.append("D=A")
+    commands.append("@" + routineLabel)
+    commands.append("0;JMP")
 
-#Parse .vm files
-for filePath in filePaths:
-    fileName = filePath[filePath.rfind("/") + 1:filePath.rfind(".vm")]
+    commands.append("(" + compareLabel + ")")
 
-    with open(filePath,"r") as reader:
-        lines = reader.readlines()
+    return commands
 
-    #Strip white space from beginning and ending of lines
-    lines = [x.strip() for x in lines]
 
-    for line in lines:
-        processedLine = ()
+def GenerateComparisonRoutineCode(cType, routineLabel, trueLabel):
+    """Generate the routine shared by the cold comparisons of one comparison type.
 
-        lineNumber += 1
+    The routine replaces the top two stack values with the comparison result, the same
+    way GenerateComparisonCode does, and returns to the address passed in D.
+    """
 
-        #strip out comments
-        commentStart = line.find("//")
+    commands = []
 
-        if commentStart > -1:
-            line = line[0:commentStart]
+    commands.append("")
+    commands.append("(" + routineLabel + ")" + "\t\t//Shared routine for Compare " + cType.name)
 
-        #Strip white space from what's left over
-        line = line.strip()
+    #Save the return address in R15
+    commands.append("@R15")
+    commands.append("M=D")
 
-        if not len(line) == 0:
-            words = line.split()
+    #Subtract the two compared values and assume the result is true
+    commands.append("@SP")
+    commands.append("M=M-1")
+    commands.append("A=M")
+    commands.append("D=M")
+    commands.append("A=A-1")
+    commands.append("D=M-D")
+    commands.append("M=-1")
 
-            cType = commands.get(words[0], CommandType.Invalid)
+    #Skip to the trueLabel if the condition is true
+    commands.append("@" + trueLabel)
+
+    if cType == ComparisonType.EQ:
+        commands.append("D;JEQ")
 
-            #Arithmetic operations
-            if cType == CommandType.Arithmetic and len(words) == 1:
-                aType = arithmeticTypes.get(words[0])
-                processedLine = (cType, aType) 
+    elif cType == ComparisonType.GT:
+        commands.append("D;JGT")
 
-            #Comparison operations
-            elif cType == CommandType.Comparison and len(words) == 1:
-                aType = comparisonTypes.get(words[0])
-                processedLine = (cType, aType) 
+    elif cType == ComparisonType.LT:
+        commands.append("D;JLT")
 
-            #Push and pop operations
-            elif len(words) == 3 and (cType == CommandType.Push or cType == CommandType.Pop):
-                segment = memorySegments.get(words[1], MemorySegment.Invalid) 
+    #Change the top stack value to false.
+    commands.append("@SP")
+    commands.append("A=M-1")
+    commands.append("M=0")
 
-                if segment == MemorySegment.Invalid or not words[2].isdigit():
-                    processedLine = (CommandType.Invalid, lineNumber)
+    #Return to the comparison
+    commands.append("(" + trueLabel + ")")
+    commands.append("@R15")
+    commands.append("A=M")
+    commands.append("0;JMP")
 
-                else:
-                    #Include the file name in the line because pushing and popping 
-                    #the static segment requires the file name as a symbol
-                    processedLine = (cType, segment, words[2], fileName)
+    return commands
 
-            #Create a label, goto a label, if-goto a label
-            elif len(words) == 2 and (cType == CommandType.Label or cType == CommandType.Goto or cType == CommandType.IfGoto):
-                processedLine = (cType, words[1])
 
-            #Function definition
-            elif cType == CommandType.Function and len(words) == 3:
-                if words[1] == "Sys.init":
-                    sys_init = True
+def GenerateSharedFunctionCallCode(functionName, frameSize, returnLabel, routineLabel):
+    """Translate a VM Function call command to a jump to the shared call routine.
 
-                processedLine = (cType, words[1], int(words[2]))
+    frameSize is the argument count plus the 5 saved registers, which is the distance
+    between the new ARG and LCL.  The routine is passed the return address in D, the
+    address of the called function in R13 and frameSize in R14.
+    """
 
-            #Function call
-            elif cType == CommandType.Call and len(words) == 3:
-                processedLine = (cType, words[1], int(words[2]))
+    commands = []
 
-            #Return from a function
-            elif cType == CommandType.Return and len(words) == 1:
-                processedLine = (cType, 0)
+    comment = "\t\t//Call function " + functionName + " in shared routine"
+    commands.append(comment)
 
-            #Unrecognized commands
-            else:
-                processedLine = (CommandType.Invalid, lineNumber)
+    commands.append("@" + str(frameSize))
+    commands.append("D=A")
+    commands.append("@R14")
+    commands.append("M=D")
 
-            #Determine if command is valid
-            if processedLine[0] == CommandType.Invalid:
-                errors.append(processedLine)
-            else:
-                processedLines.append(processedLine)
+    commands.append("@" + functionName)
+    commands.append("D=A")
+    commands.append("@R13")
+    commands.append("M=D")
 
-#Check if Sys.init function definition was found
-if not sys_init:
-    print("Sys.init function definition not found. Waddaya want from me?")
-#Print errors if they exist
-elif len(errors) > 0:
-    print("Invalid command on line:")
+    #Pass the return address in D and jump to the routine
+    commands.append("@" + returnLabel)
+    commands.append("D=A")
+    commands.append("@" + routineLabel)
+    commands.append("0;JMP")
 
-    for error in errors:
-        print("    " + str(error[1]) + " " + lines[error[1] - 1])
+    #Create return label
+    commands.append("(" + returnLabel + ")")
 
-#Translate code
-else:
- 
-    hackCommands = GenerateBootStrapCode()
+    return commands
 
-    #Default function name for each file
-    functionName = "NONE"
 
-    for line in processedLines:
-        translation = []
-        cType = line[0]
+def GenerateCallRoutineCode(routineLabel):
+    """Generate the routine shared by the cold function calls.
 
-        if cType == CommandType.Push:
-            translation = GeneratePushCode(line)
+    The routine builds the same frame as GenerateFunctionCallCode and jumps to the
+    called function.
+    """
 
-        elif cType == CommandType.Pop:
-            translation = GeneratePopCode(line)
+    commands = []
 
-        elif cType == CommandType.Arithmetic:
-            translation = GenerateArithmeticCode(line)
+    commands.append("")
+    commands.append("(" + routineLabel + ")" + "\t\t//Shared routine for function calls")
 
-        elif cType == CommandType.Comparison:
-            comparisonCount += 1
-            translation = GenerateComparisonCode(line, comparisonCount)
-
-        elif cType == CommandType.Label:
-            #translation.append("\t\t//Label")
-            translation.append("")
-            translation.append("(" + functionName + "$" + line[1] + ")")
-            translation.append("")
-
-        elif cType == CommandType.Goto:
-            #Load the address into A and jump
-            comment = "\t\t//Goto label " + functionName + "$" + line[1]
-            translation.append("@" + functionName + "$" + line[1] + comment)
-            translation.append("0;JMP")
-
-        elif cType == CommandType.IfGoto:
-            translation.append("\t\t//If-Goto label " + functionName + "$" + line[1])
-            
-            #Get stack pointer
-            translation.append("@SP")
+    #Push the return address passed in D
+    commands.append("@SP")
+    commands.append("M=M+1")
+    commands.append("A=M-1")
+    commands.append("M=D")
+
+    #Push LCL, ARG, THIS, and THAT to the stack
+    commands.extend(PushAddress("LCL"))
+    commands.extend(PushAddress("ARG"))
+    commands.extend(PushAddress("THIS"))
+    commands.extend(PushAddress("THAT"))
+
+    #Reposition the ARG pointer
+    commands.append("@R14")
+    commands.append("D=M")
+    commands.append("@SP")
+    commands.append("D=M-D")
+    commands.append("@ARG")
+    commands.append("M=D")
+
+    #Repostion the LCL pointer
+    commands.append("@SP")
+    commands.append("D=M")
+    commands.append("@LCL")
+    commands.append("M=D")
 
-            #Decrement the pointer value
-            translation.append("M=M-1")
+    #Jump to the called function
+    commands.append("@R13")
+    commands.append("A=M")
+    commands.append("0;JMP")
 
-            #point to the top of the stack
-            translation.append("A=M")
+    return commands
 
-            #Save the top stack value into D
-            translation.append("D=M")
 
-            #Load the address into A and jump if D is non-zero
-            translation.append("@" + functionName + "$" + line[1])
-            translation.append("D;JNE")
+"""The code generators above build the literal translation of a single command.  The output
+of a command never changes for the same command, segment and index, so the translator
+renders each command once into a text block with str.format placeholders for the parts that
+do vary (index, file name, labels).  Translation then only fills in placeholders and joins
+text blocks.
+"""
 
-        elif cType == CommandType.Call:
-            callCount += 1
-            functionName = line[1]
-            returnName = functionName + ".RETURN" + ":" + str(callCount)
-            translation = GenerateFunctionCallCode(functionName, line[2], returnName)
+#Number of instantiated push and pop fragments kept by MemoryAccessFragment
+FRAGMENT_CACHE_SIZE = 4096
 
-        elif cType == CommandType.Function:
-            functionName = line[1]
-            translation = GenerateFunctionDefinitionCode(functionName, line[2])
-            
-        elif cType == CommandType.Return:
-            translation = GenerateReturnCode()
 
-        hackCommands.extend(translation)
+def RenderTemplate(commands):
+    """Join a Python list of assembly instructions into one newline terminated text block."""
+
+    return "\n".join(commands) + "\n"
+
+
+def CompactText(hackCode):
+    """Remove comments, blank lines and trailing white space from an assembly text block."""
+
+    hackCommands = []
+
+    for hackCommand in hackCode.split("\n"):
+        hackCommand = hackCommand.split("//", 1)[0].rstrip()
+
+        if hackCommand:
+            hackCommands.append(hackCommand)
+
+    if not hackCommands:
+        return ""
+
+    return RenderTemplate(hackCommands)
+
+
+def InitializeTemplateDictionary(compact=False):
+    """Relate each command to its pre-rendered assembly text block with a dictionary.
+
+    If compact is True the text blocks hold no comments or blank lines.
+    """
+
+    templates = {}
+
+    #Arithmetic and comparison templates are keyed by the processed line itself
+    for aType in ArithmeticType:
+        line = (CommandType.Arithmetic, aType)
+        templates[line] = RenderTemplate(GenerateArithmeticCode(line))
+
+    for cType in ComparisonType:
+        line = (CommandType.Comparison, cType)
+        templates[line] = RenderTemplate(GenerateComparisonCode(line, "{count}")).replace("COMPARE:{count}", "{label}")
+
+    #The pointer and temp segments turn the index into a register number, so they
+    #have no template and are rendered for each index by MemoryAccessFragment
+    for segment in MemorySegment:
+        if segment in (MemorySegment.Pointer, MemorySegment.Temp, MemorySegment.Invalid):
+            continue
+
+        line = (CommandType.Push, segment, "{index}", "{file}")
+        templates[line[:2]] = RenderTemplate(GeneratePushCode(line))
+
+        line = (CommandType.Pop, segment, "{index}", "{file}")
+        templates[line[:2]] = RenderTemplate(GeneratePopCode(line))
+
+    templates[CommandType.Label] = RenderTemplate(GenerateLabelCode("{label}"))
+    templates[CommandType.Goto] = RenderTemplate(GenerateGotoCode("{label}"))
+    templates[CommandType.IfGoto] = RenderTemplate(GenerateIfGotoCode("{label}"))
+
+    templates[CommandType.Call] = RenderTemplate(
+            GenerateFunctionCallCode("{function}", "{argumentCount}", "{returnLabel}"))
+
+    #Cold comparisons and calls jump to shared routines
+    for cType in ComparisonType:
+        line = (CommandType.Comparison, cType)
+        templates[line + ("shared",)] = RenderTemplate(GenerateSharedComparisonCallCode(line, "{routine}", "{label}"))
+
+    templates[(CommandType.Call, "shared")] = RenderTemplate(
+            GenerateSharedFunctionCallCode("{function}", "{frameSize}", "{returnLabel}", "{routine}"))
+
+    templates[CommandType.Return] = RenderTemplate(GenerateReturnCode())
+
+    #Specialized epilogues are keyed by whether they restore THIS and THAT and
+    #whether the function is always called without arguments
+    for restorePointers in (False, True):
+        for zeroArguments in (False, True):
+            templates[(CommandType.Return, restorePointers, zeroArguments)] = RenderTemplate(
+                    GenerateSpecializedReturnCode(restorePointers, zeroArguments))
+
+    if compact:
+        for key, template in templates.items():
+            templates[key] = CompactText(template)
+
+    return templates
+
+
+TEMPLATES = InitializeTemplateDictionary()
+COMPACT_TEMPLATES = InitializeTemplateDictionary(compact=True)
+
+
+@functools.lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def MemoryAccessFragment(line, compact=False):
+    """Return the assembly text block for a processed push or pop line."""
+
+    templates = COMPACT_TEMPLATES if compact else TEMPLATES
+    template = templates.get(line[:2])
+
+    if template is not None:
+        return template.format(index=line[2], file=line[3])
+
+    if line[0] == CommandType.Push:
+        hackCode = RenderTemplate(GeneratePushCode(line))
+    else:
+        hackCode = RenderTemplate(GeneratePopCode(line))
+
+    if compact:
+        return CompactText(hackCode)
+
+    return hackCode
+
+
+#Functions with more local variables than this zero them with a loop when
+#functions are specialized
+LOCAL_LOOP_THRESHOLD = 4
+
+#VM lines executed at least this many times are hot in a profile guided translation
+HOT_COUNT_THRESHOLD = 1000
+
+
+class TranslationOptions:
+    """Code generation choices that depart from the literal translation.
+
+    specializeFunctions turns on per function prologues and epilogues:  functions with more
+    than localLoopThreshold local variables zero them with a loop, functions with several
+    returns share one epilogue, and the epilogue skips work the function analysis shows
+    is not needed.
+
+    compact leaves out comments and blank lines and replaces each label the translator
+    generates with a short name starting with $, which VM identifiers cannot start with.
+
+    profile is a dictionary of execution counts read with ReadProfile.  With a profile,
+    comparisons and calls on lines executed at least hotThreshold times are translated
+    inline and all others jump to routines shared by the whole program.  Cold functions
+    zero their local variables with a loop and hot functions unroll it.
+    """
+
+    def __init__(self, specializeFunctions=False, localLoopThreshold=LOCAL_LOOP_THRESHOLD, compact=False,
+            profile=None, hotThreshold=HOT_COUNT_THRESHOLD):
+        self.specializeFunctions = specializeFunctions
+        self.localLoopThreshold = localLoopThreshold
+        self.compact = compact
+        self.profile = profile
+        self.hotThreshold = hotThreshold
+
+
+class FunctionInfo:
+    """What a scan of the whole program shows about one function."""
+
+    def __init__(self):
+        #Number of return commands in the function
+        self.returnCount = 0
+
+        #True if the function pops to the pointer segment, changing THIS or THAT
+        self.setsPointers = False
+
+        #Argument counts of every call to the function
+        self.argumentCounts = set()
+
+
+def AnalyzeFunctions(processedLines):
+    """Relate each function name to its FunctionInfo with a dictionary.
+
+    Commands before the first function definition belong to the function "NONE".
+    """
+
+    functions = {"NONE": FunctionInfo(), "Sys.init": FunctionInfo()}
+
+    #The bootstrap code calls Sys.init without arguments
+    functions["Sys.init"].argumentCounts.add(0)
+
+    info = functions["NONE"]
+
+    for line in processedLines:
+        cType = line[0]
+
+        if cType == CommandType.Function:
+            info = functions.setdefault(line[1], FunctionInfo())
+
+        elif cType == CommandType.Return:
+            info.returnCount += 1
+
+        elif cType == CommandType.Pop and line[1] == MemorySegment.Pointer:
+            info.setsPointers = True
+
+        elif cType == CommandType.Call:
+            functions.setdefault(line[1], FunctionInfo()).argumentCounts.add(line[2])
+
+    return functions
+
+
+def ProfileKey(fileName, lineNumber):
+    """Return the profile key of a VM line, such as Main.vm:12."""
+
+    return fileName + ".vm:" + str(lineNumber)
+
+
+def ReadProfile(profilePath):
+    """Read a profile file into a dictionary relating each key to its execution count.
+
+    Each line of the file holds a key and a count separated by white space.  A key is
+    either a VM line, written as file_name.vm:line_number, or a label, written as a
+    function name for the entry of the function or as function_name$label.  Blank lines
+    and lines starting with # are ignored.  An invalid line raises a ValueError.
+    """
+
+    profile = {}
+
+    with open(profilePath, "r") as reader:
+        for lineNumber, line in enumerate(reader, 1):
+            words = line.split()
+
+            if not words or words[0][0] == "#":
+                continue
+
+            if len(words) != 2 or not words[1].isdigit():
+                raise ValueError(profilePath + ":" + str(lineNumber) + " invalid profile line " + line.strip())
+
+            profile[words[0]] = profile.get(words[0], 0) + int(words[1])
+
+    return profile
+
+
+def WriteProfile(profilePath, profile):
+    """Write a dictionary of execution counts in the format ReadProfile reads."""
+
+    with open(profilePath, "w") as writer:
+        writer.write("".join(key + " " + str(count) + "\n" for key, count in profile.items()))
+
+
+def LineCounts(processedLines, sourceLines, profile):
+    """Return a Python list of the execution count of each processed line according to a profile.
+
+    A line without a count of its own takes the count of the function entry or label
+    it follows, and 0 if that has no count either.  sourceLines may be None, in which
+    case only label counts are used.
+    """
+
+    counts = []
+    blockCount = 0
+    functionName = "NONE"
+
+    for index, line in enumerate(processedLines):
+        if line[0] == CommandType.Function:
+            functionName = line[1]
+            blockCount = profile.get(functionName, 0)
+
+        elif line[0] == CommandType.Label:
+            blockCount = profile.get(functionName + "$" + line[1], 0)
+
+        if sourceLines is None:
+            counts.append(blockCount)
+        else:
+            counts.append(profile.get(ProfileKey(*sourceLines[index]), blockCount))
+
+    return counts
+
+
+def ShortName(number):
+    """Return the short label name for the given number:  $0 through $z, then $10 and so on."""
+
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    name = ""
+
+    while True:
+        name = digits[number % 36] + name
+        number //= 36
+
+        if number == 0:
+            return "$" + name
+
+
+class TranslationState:
+    """Values carried from one command to the next while a program is translated."""
+
+    def __init__(self, options, functions=None, symbols=None):
+        self.options = options
+
+        #FunctionInfo of each function, when functions are specialized
+        self.functions = functions
+
+        #Text blocks for each command
+        self.templates = COMPACT_TEMPLATES if options.compact else TEMPLATES
+
+        #In compact mode, the short name of each generated label is related to its
+        #original name in symbols, and shortNames holds the reverse
+        self.symbols = symbols
+        self.shortNames = {}
+
+        #The function whose definition the current command belongs to.  Labels are
+        #qualified with this function name.
+        self.functionName = "NONE"
+
+        #Track the number of times a comparison is made.
+        #comparisonCount is used to form label names for jumps
+        #that are necessary for the comparison operators
+        #and ensures the labels all have unique names.
+        self.comparisonCount = 0
+
+        #Track the number of time a function call is made.
+        #callCount is used to form return labels and ensures
+        #the labels all have unique names.
+        self.callCount = 0
+
+        #Functions whose shared epilogue has been emitted
+        self.sharedEpilogues = set()
+
+        #Number of functions that zero their local variables with a loop
+        self.localLoopCount = 0
+
+        #Execution count of each processed line in a profile guided translation,
+        #and the index of the line being translated
+        self.lineCounts = None
+        self.lineIndex = 0
+
+        #Text of each shared routine that has been generated, keyed by its original label
+        self.sharedRoutines = {}
+
+    def IsHot(self):
+        """Return True if the profile shows the line being translated is hot."""
+
+        return self.lineCounts[self.lineIndex] >= self.options.hotThreshold
+
+    def GeneratedLabel(self, name):
+        """Return the name to use for a label the translator generated.
+
+        In compact mode the label is interned under a short name.
+        """
+
+        if not self.options.compact:
+            return name
+
+        shortName = self.shortNames.get(name)
+
+        if shortName is None:
+            shortName = ShortName(len(self.shortNames))
+            self.shortNames[name] = shortName
+            self.symbols[shortName] = name
+
+        return shortName
+
+
+def TranslateMemoryAccess(line, state):
+    """Translate a VM Push or Pop command to an assembly text block."""
+
+    return MemoryAccessFragment(line, state.options.compact)
+
+
+def TranslateArithmetic(line, state):
+    """Translate a VM Arithmetic command to an assembly text block."""
+
+    return state.templates[line]
+
+
+def TranslateComparison(line, state):
+    """Translate a VM Comparison command to an assembly text block."""
+
+    state.comparisonCount += 1
+    compareLabel = state.GeneratedLabel("COMPARE:" + str(state.comparisonCount))
+    return state.templates[line].format(label=compareLabel)
+
+
+def TranslateLabel(line, state):
+    """Translate a VM Label, Goto or If-Goto command to an assembly text block."""
+
+    return state.templates[line[0]].format(label=state.functionName + "$" + line[1])
+
+
+def TranslateCall(line, state):
+    """Translate a VM Function call command to an assembly text block."""
+
+    state.callCount += 1
+    returnName = state.GeneratedLabel(line[1] + ".RETURN" + ":" + str(state.callCount))
+    return state.templates[CommandType.Call].format(function=line[1], argumentCount=line[2], returnLabel=returnName)
+
+
+def FunctionText(commands, state):
+    """Render the code generated for a function definition, compacting it in compact mode."""
+
+    if state.options.compact:
+        return CompactText(RenderTemplate(commands))
+
+    return RenderTemplate(commands)
+
+
+def TranslateFunction(line, state):
+    """Translate a VM Function Definition command to an assembly text block."""
+
+    #A function is defined once, so its code is generated directly
+    state.functionName = line[1]
+    return FunctionText(GenerateFunctionDefinitionCode(line[1], line[2]), state)
+
+
+def TranslateReturn(line, state):
+    """Translate a VM Return command to an assembly text block."""
+
+    return state.templates[CommandType.Return]
+
+
+def TranslateSpecializedFunction(line, state):
+    """Translate a VM Function Definition command, zeroing many local variables with a loop.
+
+    In a profile guided translation, cold functions use the loop whenever it is shorter
+    and hot functions never use it.
+    """
+
+    state.functionName = line[1]
+
+    if state.lineCounts is not None:
+        useLoop = line[2] > 1 and not state.IsHot()
+    else:
+        useLoop = line[2] > state.options.localLoopThreshold
+
+    if useLoop:
+        state.localLoopCount += 1
+        loopLabel = state.GeneratedLabel(line[1] + "$$LOCALS")
+        return FunctionText(GenerateLocalLoopCode(line[1], line[2], loopLabel), state)
+
+    return FunctionText(GenerateFunctionDefinitionCode(line[1], line[2]), state)
+
+
+def TranslateSpecializedReturn(line, state):
+    """Translate a VM Return command with the cheapest epilogue that is correct for its function.
+
+    The first return of a function with several returns emits the epilogue under a
+    label and the others jump to it.
+    """
+
+    info = state.functions[state.functionName]
+    epilogue = state.templates[(CommandType.Return, info.setsPointers, info.argumentCounts == {0})]
+
+    if info.returnCount < 2:
+        return epilogue
+
+    epilogueLabel = state.GeneratedLabel(state.functionName + "$$RETURN")
+
+    if state.functionName in state.sharedEpilogues:
+        return state.templates[CommandType.Goto].format(label=epilogueLabel)
+
+    state.sharedEpilogues.add(state.functionName)
+
+    return "(" + epilogueLabel + ")\n" + epilogue
+
+
+def ComparisonRoutine(cType, state):
+    """Return the label of the shared routine for a comparison type, generating the routine the first time."""
+
+    routineName = "$$COMPARE." + cType.name
+    routineLabel = state.GeneratedLabel(routineName)
+
+    if routineName not in state.sharedRoutines:
+        trueLabel = state.GeneratedLabel(routineName + ".TRUE")
+        state.sharedRoutines[routineName] = FunctionText(GenerateComparisonRoutineCode(cType, routineLabel, trueLabel), state)
+
+    return routineLabel
+
+
+def CallRoutine(state):
+    """Return the label of the shared call routine, generating the routine the first time."""
+
+    routineName = "$$CALL"
+    routineLabel = state.GeneratedLabel(routineName)
+
+    if routineName not in state.sharedRoutines:
+        state.sharedRoutines[routineName] = FunctionText(GenerateCallRoutineCode(routineLabel), state)
+
+    return routineLabel
+
+
+def TranslateProfiledComparison(line, state):
+    """Translate a VM Comparison command inline if it is hot and to a shared routine call if not."""
+
+    if state.IsHot():
+        return TranslateComparison(line, state)
+
+    state.comparisonCount += 1
+    compareLabel = state.GeneratedLabel("COMPARE:" + str(state.comparisonCount))
+    routineLabel = ComparisonRoutine(line[1], state)
+    return state.templates[line + ("shared",)].format(label=compareLabel, routine=routineLabel)
+
+
+def TranslateProfiledCall(line, state):
+    """Translate a VM Function call command inline if it is hot and to a shared routine call if not."""
+
+    if state.IsHot():
+        return TranslateCall(line, state)
+
+    state.callCount += 1
+    returnName = state.GeneratedLabel(line[1] + ".RETURN" + ":" + str(state.callCount))
+    routineLabel = CallRoutine(state)
+    return state.templates[(CommandType.Call, "shared")].format(
+            function=line[1], frameSize=line[2] + 5, returnLabel=returnName, routine=routineLabel)
+
+
+def InitializeTranslatorDictionary(options):
+    "Relate each command type to the function that translates it with a dictionary."
+
+    translators = {
+            CommandType.Arithmetic  :TranslateArithmetic,
+            CommandType.Comparison  :TranslateComparison,
+            CommandType.Push        :TranslateMemoryAccess,
+            CommandType.Pop         :TranslateMemoryAccess,
+            CommandType.Label       :TranslateLabel,
+            CommandType.Goto        :TranslateLabel,
+            CommandType.IfGoto      :TranslateLabel,
+            CommandType.Function    :TranslateFunction,
+            CommandType.Call        :TranslateCall,
+            CommandType.Return      :TranslateReturn
+            }
+
+    if options.specializeFunctions:
+        translators[CommandType.Function] = TranslateSpecializedFunction
+        translators[CommandType.Return] = TranslateSpecializedReturn
+
+    if options.profile is not None:
+        translators[CommandType.Function] = TranslateSpecializedFunction
+        translators[CommandType.Comparison] = TranslateProfiledComparison
+        translators[CommandType.Call] = TranslateProfiledCall
+
+    return translators
+
+
+def SingleWordParser(processedLine):
+    """Build a parser for a command that takes no arguments.
+
+    Every valid occurrence of the command parses to the same tuple, so it is
+    built once and shared.
+    """
+
+    def Parse(words, fileName):
+        if len(words) == 1:
+            return processedLine
+
+        return None
+
+    return Parse
+
+
+def MemoryAccessParser(cType, memorySegments):
+    """Build a parser for a push or pop command."""
+
+    def Parse(words, fileName):
+        if len(words) != 3 or not words[2].isdigit():
+            return None
+
+        segment = memorySegments.get(words[1])
+
+        if segment is None:
+            return None
+
+        #Include the file name in the line because pushing and popping 
+        #the static segment requires the file name as a symbol
+        return (cType, segment, words[2], fileName)
+
+    return Parse
+
+
+def LabelParser(cType):
+    """Build a parser for a label, goto or if-goto command."""
+
+    def Parse(words, fileName):
+        if len(words) == 2:
+            return (cType, words[1])
+
+        return None
+
+    return Parse
+
+
+def FunctionParser(cType):
+    """Build a parser for a function definition or function call command."""
+
+    def Parse(words, fileName):
+        if len(words) == 3 and words[2].isdigit():
+            return (cType, words[1], int(words[2]))
+
+        return None
+
+    return Parse
+
+
+def InitializeParserDictionary():
+    "Relate each VM command directly to the function that parses and validates it."
+
+    memorySegments = InitializeMemorySegmentDictionary()
+    arithmeticTypes = InitializeArithmeticTypeDictionary()
+    comparisonTypes = InitializeComparisonTypeDictionary()
+
+    parsers = {}
+
+    for word, cType in InitializeCommandTypeDictionary().items():
+        if cType == CommandType.Arithmetic:
+            parsers[word] = SingleWordParser((cType, arithmeticTypes[word]))
+
+        elif cType == CommandType.Comparison:
+            parsers[word] = SingleWordParser((cType, comparisonTypes[word]))
+
+        elif cType == CommandType.Push or cType == CommandType.Pop:
+            parsers[word] = MemoryAccessParser(cType, memorySegments)
+
+        elif cType == CommandType.Label or cType == CommandType.Goto or cType == CommandType.IfGoto:
+            parsers[word] = LabelParser(cType)
+
+        elif cType == CommandType.Function or cType == CommandType.Call:
+            parsers[word] = FunctionParser(cType)
+
+        elif cType == CommandType.Return:
+            parsers[word] = SingleWordParser((cType, 0))
+
+    return parsers
+
+
+#Files at least this large are memory mapped rather than read into a buffer
+MMAP_THRESHOLD = 1 << 20
+
+#Matches each line whose first non-blank characters are not a comment.  Blank
+#lines and comment-only lines are skipped inside the regex engine.
+COMMAND_LINE_PATTERN = re.compile(r"^[^\S\n]*(?!//)(\S[^\n]*)", re.MULTILINE)
+
+
+def FindVMFiles(inputPath):
+    """Return the .vm files found at inputPath and the path of the .asm file to write."""
+
+    filePaths = []
+    outputFilePath = ""
+
+    if inputPath[-3:] == ".vm":
+        filePaths.append(inputPath)
+        outputFilePath = inputPath[:-3] + ".asm"
+    else:
+        filePaths = glob.glob(inputPath + "/*.vm")
+
+        dirNameStart = inputPath.rfind("/", 0, len(inputPath) - 1) 
+        dirName = inputPath[dirNameStart:].strip("/")
+
+        if inputPath[-1:] == "/":
+            outputFilePath = inputPath + dirName + ".asm"
+        else:
+            outputFilePath = inputPath + "/" + dirName + ".asm"
+
+    return filePaths, outputFilePath
+
+
+def ReadVMFile(filePath):
+    """Read a whole .vm file into a single string."""
+
+    with open(filePath, "rb") as reader:
+        size = os.fstat(reader.fileno()).st_size
+
+        if size < MMAP_THRESHOLD:
+            return reader.read().decode("utf-8")
+
+        with mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return str(buffer, "utf-8")
+
+
+def ReadVMFiles(filePaths):
+    """Read every .vm file and return a list of (file name, source) pairs."""
+
+    sources = []
+
+    for filePath in filePaths:
+        fileName = filePath[filePath.rfind("/") + 1:filePath.rfind(".vm")]
+        sources.append((fileName, ReadVMFile(filePath)))
+
+    return sources
+
+
+def TokenizeVMSource(source):
+    """Yield (line number, words, text) for every line of source that holds a command.
+
+    Blank lines and comments are discarded.  text is the command as written, 
+    without leading or trailing white space, and is kept for error messages.
+    """
+
+    lineNumber = 1
+    position = 0
+
+    for match in COMMAND_LINE_PATTERN.finditer(source):
+        start = match.start()
+        lineNumber += source.count("\n", position, start)
+        position = start
+
+        text = match.group(1)
+
+        #strip out trailing comments
+        if "/" in text:
+            words = text.split("//", 1)[0].split()
+        else:
+            words = text.split()
+
+        yield lineNumber, words, text.rstrip()
+
+
+def ParseVMFiles(sources):
+    """Parse the VM commands of every (file name, source) pair.
+
+    Returns three lists:  the processed lines, the (file name, line number) each
+    processed line came from, and the invalid commands found.  Each invalid command
+    is recorded as (CommandType.Invalid, line number, file name, text).
+    """
+
+    parsers = InitializeParserDictionary()
+
+    processedLines = []
+    sourceLines = []
+    errors = []
+
+    for fileName, source in sources:
+        for lineNumber, words, text in TokenizeVMSource(source):
+            parser = parsers.get(words[0])
+            processedLine = None
+
+            if parser is not None:
+                processedLine = parser(words, fileName)
+
+            #Determine if command is valid
+            if processedLine is None:
+                errors.append((CommandType.Invalid, lineNumber, fileName, text))
+            else:
+                processedLines.append(processedLine)
+                sourceLines.append((fileName, lineNumber))
+
+    return processedLines, sourceLines, errors
+
+
+#Number of words in the Hack instruction memory
+ROM_SIZE = 32768
+
+#Translation phases in the order they run
+PHASES = ("discovery", "read", "parse", "codegen", "write")
+
+
+@functools.lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def CountInstructions(hackCode):
+    """Count the instructions in an assembly text block.
+
+    Blank lines, comment lines and label declarations do not take up ROM space.
+    """
+
+    count = 0
+
+    for hackCommand in hackCode.split("\n"):
+        if hackCommand and hackCommand[0] not in "\t(/":
+            count += 1
+
+    return count
+
+
+class TranslationStats:
+    """Collect phase timings and command, instruction and label counts for one translation.
+
+    beforePhase and afterPhase are optional callbacks for an outside metrics collector.
+    beforePhase(phase) is called when a phase starts and afterPhase(phase, seconds) when
+    it ends, where phase is one of PHASES.
+    """
+
+    def __init__(self, beforePhase=None, afterPhase=None):
+        self.beforePhase = beforePhase
+        self.afterPhase = afterPhase
+
+        self.phaseSeconds = {}
+        self.commandCounts = {}
+        self.segmentCounts = {}
+        self.instructionsByCommand = {}
+        self.instructionsByFunction = {}
+        self.labelCounts = {}
+        self.romWords = 0
+
+    @contextlib.contextmanager
+    def Phase(self, phase):
+        """Time the code run inside the with block as the given phase."""
+
+        if self.beforePhase is not None:
+            self.beforePhase(phase)
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phaseSeconds[phase] = self.phaseSeconds.get(phase, 0.0) + seconds
+
+            if self.afterPhase is not None:
+                self.afterPhase(phase, seconds)
+
+    def RecordFragment(self, line, functionName, hackCode):
+        """Count a translated command and the instructions emitted for it."""
+
+        commandName = line[0].name
+        self.commandCounts[commandName] = self.commandCounts.get(commandName, 0) + 1
+
+        if line[0] == CommandType.Push or line[0] == CommandType.Pop:
+            segmentName = commandName + " " + line[1].name
+            self.segmentCounts[segmentName] = self.segmentCounts.get(segmentName, 0) + 1
+
+        self.RecordInstructions(commandName, functionName, hackCode)
+
+    def RecordSupportCode(self, name, hackCode):
+        """Count the instructions of code that belongs to no VM command, such as the bootstrap code.
+
+        The instructions are counted under name as their command type and under name in
+        lower case and parentheses as their function.
+        """
+
+        self.RecordInstructions(name, "(" + name.lower() + ")", hackCode)
+
+    def RecordInstructions(self, commandName, functionName, hackCode):
+        """Count the instructions in hackCode toward a command type and a function."""
+
+        count = CountInstructions(hackCode)
+
+        self.instructionsByCommand[commandName] = self.instructionsByCommand.get(commandName, 0) + count
+        self.instructionsByFunction[functionName] = self.instructionsByFunction.get(functionName, 0) + count
+        self.romWords += count
+
+    def RecordLabels(self, state):
+        """Record how many labels the translator generated."""
+
+        self.labelCounts["COMPARE"] = state.comparisonCount
+        self.labelCounts["RETURN"] = state.callCount
+        self.labelCounts["$$RETURN"] = len(state.sharedEpilogues)
+        self.labelCounts["$$LOCALS"] = state.localLoopCount
+        self.labelCounts["$$ROUTINES"] = len(state.sharedRoutines)
+
+    def AsDict(self):
+        """Return the statistics as a dictionary suitable for json.dumps."""
+
+        return {
+                "phaseSeconds"              :self.phaseSeconds,
+                "commands"                  :self.commandCounts,
+                "segments"                  :self.segmentCounts,
+                "instructionsByCommand"     :self.instructionsByCommand,
+                "instructionsByFunction"    :self.instructionsByFunction,
+                "labels"                    :self.labelCounts,
+                "romWords"                  :self.romWords,
+                "romSize"                   :ROM_SIZE
+                }
+
+    def Report(self):
+        """Return the statistics as human readable text."""
+
+        report = []
+
+        report.append("Phase times (ms):")
+        for phase in PHASES:
+            if phase in self.phaseSeconds:
+                report.append("    {:<24}{:>10.2f}".format(phase, self.phaseSeconds[phase] * 1000))
+
+        sections = [
+                ("Commands:", self.commandCounts),
+                ("Push/pop segments:", self.segmentCounts),
+                ("Instructions per command type:", self.instructionsByCommand),
+                ("Instructions per function:", self.instructionsByFunction),
+                ("Generated labels:", self.labelCounts)
+                ]
+
+        for title, counts in sections:
+            report.append(title)
+
+            for name, count in sorted(counts.items(), key=lambda item: -item[1]):
+                report.append("    {:<24}{:>10}".format(name, count))
+
+        report.append("ROM: {} / {} words ({:.1f}%)".format(self.romWords, ROM_SIZE, 100.0 * self.romWords / ROM_SIZE))
+
+        if self.romWords > ROM_SIZE:
+            report.append("The program does not fit in ROM.")
+
+        return "\n".join(report)
+
+
+def TimePhase(stats, phase):
+    """Return a context manager that times phase when statistics are being collected."""
+
+    if stats is None:
+        return contextlib.nullcontext()
+
+    return stats.Phase(phase)
+
+
+def TranslateVMCommands(processedLines, stats=None, options=None, symbols=None, sourceLines=None):
+    """Translate the processed lines of a program, including the bootstrap code.
+
+    Returns a Python list of newline terminated assembly text blocks.  If stats is a
+    TranslationStats, the emitted code is counted into it.  options is a TranslationOptions;
+    without it the literal translation is produced.  In compact mode, the short name of
+    each generated label is related to its original name in the symbols dictionary if
+    one is given.  sourceLines is the list of (file name, line number) pairs from
+    ParseVMFiles, which a profile guided translation needs to find per line counts.
+    """
+
+    if options is None:
+        options = TranslationOptions()
+
+    functions = None
+
+    if options.specializeFunctions:
+        functions = AnalyzeFunctions(processedLines)
+
+    if symbols is None:
+        symbols = {}
+
+    translators = InitializeTranslatorDictionary(options)
+    state = TranslationState(options, functions, symbols)
+
+    if options.profile is not None:
+        state.lineCounts = LineCounts(processedLines, sourceLines, options.profile)
+
+    hackCode = [FunctionText(GenerateBootStrapCode(), state)]
+
+    if stats is None and state.lineCounts is None:
+        for line in processedLines:
+            hackCode.append(translators[line[0]](line, state))
+
+        return hackCode
+
+    if stats is not None:
+        stats.RecordSupportCode("Bootstrap", hackCode[0])
+
+    for index, line in enumerate(processedLines):
+        state.lineIndex = index
+        translation = translators[line[0]](line, state)
+
+        if stats is not None:
+            stats.RecordFragment(line, state.functionName, translation)
+
+        hackCode.append(translation)
+
+    #Shared routines are placed after the program
+    for routine in state.sharedRoutines.values():
+        hackCode.append(routine)
+
+        if stats is not None:
+            stats.RecordSupportCode("Shared routines", routine)
+
+    if stats is not None:
+        stats.RecordLabels(state)
+
+    return hackCode
+
+
+def ReportProgramErrors(processedLines, errors):
+    """Print the reasons a parsed program cannot be translated.
+
+    Returns True if any were found.
+    """
+
+    #Every program must have a Sys.init function
+    sys_init = any(line[0] == CommandType.Function and line[1] == "Sys.init" for line in processedLines)
+
+    #Check if Sys.init function definition was found
+    if not sys_init:
+        print("Sys.init function definition not found. Waddaya want from me?")
+        return True
+
+    #Print errors if they exist
+    if len(errors) > 0:
+        print("Invalid command on line:")
+
+        for error in errors:
+            print("    " + error[2] + ":" + str(error[1]) + " " + error[3])
+
+        return True
+
+    return False
+
+
+def TranslatePath(inputPath, stats=None, options=None):
+    """Translate the .vm file or directory of .vm files at inputPath and write the .asm file.
+
+    This is the whole translation behind the command line.  If stats is a TranslationStats,
+    each phase is timed and the emitted code is counted into it.  options is a
+    TranslationOptions.  In compact mode a .map file next to the .asm file relates each
+    short label name to the original name, one "short original" pair per line.
+    Returns True if the .asm file was written.
+    """
+
+    with TimePhase(stats, "discovery"):
+        filePaths, outputFilePath = FindVMFiles(inputPath)
+
+    with TimePhase(stats, "read"):
+        sources = ReadVMFiles(filePaths)
+
+    with TimePhase(stats, "parse"):
+        processedLines, sourceLines, errors = ParseVMFiles(sources)
+
+    if ReportProgramErrors(processedLines, errors):
+        return False
+
+    symbols = {}
+
+    #Translate code
+    with TimePhase(stats, "codegen"):
+        hackCode = TranslateVMCommands(processedLines, stats, options, symbols, sourceLines)
+
+    with TimePhase(stats, "write"):
+        with open(outputFilePath, "w") as writer:
+            writer.write("".join(hackCode))
+
+        if options is not None and options.compact:
+            with open(outputFilePath[:-4] + ".map", "w") as writer:
+                writer.write("".join(shortName + " " + name + "\n" for shortName, name in symbols.items()))
+
+    return True
+
+
+def Main(argv):
+    """The main program translates VM code in two steps.  First it reads each .vm file into a single 
+    buffer, discards comments and white space, parses the VM commands and arguments, and creates a 
+    list of processed commands.  Then it translates each processed line into assembly instructions and 
+    writes the .asm file.
+
+    If any invalid VM commands are found, they are written to the screen along with their file names
+    and line numbers, and the VM translation stops without creating a file.
+
+    With --stats (or --stats=json) the phase times and code size statistics are printed
+    after the translation.  --specialize turns on per function prologues and epilogues and
+    --compact writes compact output with a symbol map.  --profile=FILE translates guided by
+    the execution counts in FILE, treating counts of at least --hot=N as hot.
+    """
+
+    inputPath = None
+    statsFormat = None
+    options = TranslationOptions()
+    profilePath = None
+    usage = "Usage: vmtranslator.py [--stats[=json]] [--specialize] [--compact] [--profile=FILE [--hot=N]] path"
+
+    for argument in argv[1:]:
+        if argument == "--stats" or argument == "--stats=text":
+            statsFormat = "text"
+        elif argument == "--stats=json":
+            statsFormat = "json"
+        elif argument == "--specialize":
+            options.specializeFunctions = True
+        elif argument == "--compact":
+            options.compact = True
+        elif argument.startswith("--profile=") and len(argument) > 10:
+            profilePath = argument[10:]
+        elif argument.startswith("--hot=") and argument[6:].isdigit():
+            options.hotThreshold = int(argument[6:])
+        elif argument.startswith("--") or inputPath is not None:
+            print(usage)
+            return
+        else:
+            inputPath = argument
+
+    if inputPath is None:
+        print(usage)
+        return
+
+    if not os.path.exists(inputPath):
+        print(inputPath + " does not exist")
+        return
+
+    if profilePath is not None:
+        try:
+            options.profile = ReadProfile(profilePath)
+        except (OSError, ValueError) as error:
+            print(error)
+            return
+
+    stats = None
+
+    if statsFormat is not None:
+        stats = TranslationStats()
+
+    TranslatePath(inputPath, stats, options)
+
+    if statsFormat == "json":
+        print(json.dumps(stats.AsDict(), indent=4))
+    elif statsFormat == "text":
+        print(stats.Report())
 
-    writer = open(outputFilePath, "w")
 
-    for hackCommand in hackCommands:
-            writer.write(hackCommand + "\n") 
+if __name__ == "__main__":
+    Main(sys.argv)